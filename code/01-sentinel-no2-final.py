@@ -1,15 +1,21 @@
-# This script requires the following packages: pip install openeo xarray numpy netCDF4 scipy geopandas shapely
+# This script requires the following packages: pip install openeo xarray numpy netCDF4 scipy
 
 import openeo
 import xarray as xr
 import numpy as np
 import os
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 import netCDF4
-from scipy.interpolate import griddata
-from shapely.geometry import box
-import geopandas as gpd
+from scipy.interpolate import CubicSpline
+
+# --- Configuration ---
+
+# Indonesia bounding box and its split into openEO batch jobs. The split keeps each job
+# within the backend's size limits; set GRID_DIVISIONS to {"x": 1, "y": 1} to submit one job.
+INDONESIA_EXTENT = {"west": 95.0, "east": 141.0, "south": -11.0, "north": 6.0}
+GRID_DIVISIONS = {"x": 5, "y": 2}
 
 # --- Core Functions ---
 
@@ -35,62 +41,81 @@ def process_box(connection, start_date, end_date, box_name, spatial_extent):
     """Process a single box: download, reproject, and save."""
     print(f"🔄 Processing {box_name}...")
     output_filename = os.path.join("nc", f"NO2_{box_name}_{start_date.replace('-', '')}.nc")
-    if os.path.exists(output_filename):
-        os.remove(output_filename)
+    # Tiles from an interrupted earlier run are reused, so a restart only fetches what is missing
+    if os.path.exists(output_filename) and os.path.getsize(output_filename) > 0:
+        print(f"   ⏭️ Already downloaded: {output_filename}")
+        return output_filename
 
     cube = connection.load_collection(
         "SENTINEL_5P_L2",
         spatial_extent=spatial_extent,
         temporal_extent=[start_date, end_date],
         bands=["NO2"]
-    ).filter_spatial(gpd.GeoSeries([box(spatial_extent["west"], spatial_extent["south"], spatial_extent["east"], spatial_extent["north"])]).__geo_interface__['features'][0]['geometry'])
+    )
     
     cube = cube.reduce_dimension("t", reducer="mean").resample_spatial(projection="EPSG:4326", resolution=0.01)
     
     job = connection.create_job(cube.save_result(format="NetCDF"))
     job.start_and_wait()
-    job.get_results().download_file(output_filename)
+    # Download under a temporary name so an interrupted transfer never looks like a finished tile
+    partial_filename = output_filename + ".part"
+    job.get_results().download_file(partial_filename)
+    os.replace(partial_filename, output_filename)
     print(f"   ✅ Finished: {output_filename}")
     return output_filename
 
+def process_box_with_retry(connection, date_str, box_name, spatial_extent):
+    """Process a single box, retrying until the download succeeds."""
+    while True:
+        try:
+            return process_box(connection, date_str, date_str, box_name, spatial_extent)
+        except Exception as e:
+            print(f"   ❌ Failed to process {box_name}: {e}")
+            print(f"   🔁 Retrying download for {box_name}...")
+            time.sleep(5)  # Wait 5 seconds before retrying
+
 def merge_boxes(date_str, box_files):
     """Merge all box NetCDF files into one Indonesia file."""
     print(f"\n🔗 Merging {len(box_files)} downloaded files...")
-    datasets = []
-    for file in box_files:
+    tiles = []
+    for file in sorted(box_files):
         if os.path.exists(file):
             try:
-                ds = xr.open_dataset(file)
-                # Round coordinates to fix floating point errors at tile seams
-                ds = ds.assign_coords(
-                    x=np.round(ds.x, 5),
-                    y=np.round(ds.y, 5)
-                )
-                if "NO2" in ds and ds["NO2"].size > 0:
-                    datasets.append(ds)
-                else:
-                    ds.close()
+                with xr.open_dataset(file) as ds:
+                    if "NO2" in ds and ds["NO2"].size > 0:
+                        # Round coordinates to fix floating point errors at tile seams
+                        tiles.append((
+                            np.round(ds.y.values, 5),
+                            np.round(ds.x.values, 5),
+                            ds["NO2"].squeeze(drop=True).transpose("y", "x").values
+                        ))
             except Exception:
                 pass # Ignore corrupted files
 
-    if not datasets:
+    if not tiles:
         return None
 
-    merged_ds = xr.combine_by_coords(datasets)
+    # The boxes are pieces of one regular grid, so each tile is copied straight
+    # into its slot instead of letting xarray align and concatenate them
+    y_all = np.unique(np.concatenate([y for y, _, _ in tiles]))
+    x_all = np.unique(np.concatenate([x for _, x, _ in tiles]))
+    merged = np.full((len(y_all), len(x_all)), np.nan, dtype=np.float32)
+    for y, x, values in tiles:
+        slot = np.ix_(np.searchsorted(y_all, y), np.searchsorted(x_all, x))
+        # Keep data already placed from a neighbouring tile where the seams overlap
+        merged[slot] = np.where(np.isnan(merged[slot]), values, merged[slot])
+
+    merged_ds = xr.Dataset({"NO2": (("y", "x"), merged)}, coords={"y": y_all, "x": x_all})
     merged_filename = os.path.join("nc", f"NO2_Indonesia_Daily_{date_str.replace('-', '')}_merged.nc")
     if os.path.exists(merged_filename):
         os.remove(merged_filename)
     merged_ds.to_netcdf(merged_filename)
     print(f"   ✅ Merged data saved as {merged_filename}")
-    for ds in datasets: ds.close()
     return merged_filename
 
-def create_netcdf_manually(filename, dataset, date_str):
+def create_netcdf_manually(filename, dataset, days_since_epoch):
     """Creates a NetCDF file from scratch using the netCDF4 library."""
     print(f"   -> Building NetCDF file from scratch: {filename}")
-    time_dt = datetime.strptime(date_str, "%Y-%m-%d")
-    epoch = datetime(1970, 1, 1)
-    days_since_epoch = (time_dt - epoch).days
 
     with netCDF4.Dataset(filename, 'w', format='NETCDF4') as nc:
         nc.createDimension('time', 1)
@@ -101,44 +126,96 @@ def create_netcdf_manually(filename, dataset, date_str):
         y_var = nc.createVariable('y', 'f4', ('y',)); y_var.units = 'degrees_north'; y_var[:] = dataset.y.values
         x_var = nc.createVariable('x', 'f4', ('x',)); x_var.units = 'degrees_east'; x_var[:] = dataset.x.values
 
+        # Compressed 256x256 tiles: smooth float32 fields shrink well with shuffle+zlib
+        chunksizes = (1, min(256, len(dataset.y)), min(256, len(dataset.x)))
         for var_name in dataset.data_vars:
             var = dataset[var_name]
-            nc_var = nc.createVariable(var_name, 'f4', ('time', 'y', 'x',)); setattr(nc_var, 'units', var.attrs.get('units', '')); setattr(nc_var, 'long_name', var.attrs.get('long_name', '')); nc_var[:] = var.values[np.newaxis, :, :]
+            nc_var = nc.createVariable(var_name, 'f4', ('time', 'y', 'x',), zlib=True, complevel=4, shuffle=True, chunksizes=chunksizes); setattr(nc_var, 'units', var.attrs.get('units', '')); setattr(nc_var, 'long_name', var.attrs.get('long_name', '')); nc_var[:] = var.values[np.newaxis, :, :]
     print(f"      ✅ Successfully built {filename}")
 
-def process_and_save_data(ds, date_str, method="original"):
+def interpolate_line(line, filled, method="linear"):
+    """Write into `filled` the NaN gaps of a 1D line that lie between its valid samples."""
+    valid = ~np.isnan(line)
+    positions = np.flatnonzero(valid)
+    if len(positions) < 2 or len(positions) == len(line):
+        return
+
+    # Only gaps bracketed by valid samples are filled; nothing is extrapolated
+    gaps = np.flatnonzero(~valid)
+    gaps = gaps[(gaps > positions[0]) & (gaps < positions[-1])]
+    if method == "cubic":
+        filled[gaps] = CubicSpline(positions, line[positions])(gaps)
+    else:
+        filled[gaps] = np.interp(gaps, positions, line[positions])
+
+def fill_gaps(values, method="linear"):
+    """
+    Fill NaN gaps of a regular 2D grid by interpolating along rows and columns.
+    Where both directions give an estimate the two are averaged; gaps that are not
+    bracketed by valid data in either direction stay NaN.
+    """
+    along_x = values.copy()
+    along_y = values.copy()
+    for line, filled in zip(values, along_x):
+        interpolate_line(line, filled, method)
+    for line, filled in zip(values.T, along_y.T):
+        interpolate_line(line, filled, method)
+
+    # Valid pixels are identical in both passes, so only the gaps need combining
+    rows, cols = np.nonzero(np.isnan(values))
+    est_x, est_y = along_x[rows, cols], along_y[rows, cols]
+    along_x[rows, cols] = np.where(np.isnan(est_x), est_y,
+                                   np.where(np.isnan(est_y), est_x, 0.5 * (est_x + est_y)))
+    return along_x
+
+def process_and_save_data(ds, date_str, days_since_epoch, method="original"):
     """Processes data and saves it using the manual NetCDF creation method."""
     if "NO2" in ds:
-        ds["NO2"] = ds["NO2"] * 6.022e19
-        ds["NO2"].attrs = {"units": "molecules/cm^2", "long_name": "Tropospheric vertical column of Nitrogen Dioxide"}
+        # Scale in place to avoid a second full-size array; callers hand over datasets they no longer need
+        no2 = ds["NO2"].values
+        np.multiply(no2, 6.022e19, out=no2)
+        ds["NO2"] = (ds["NO2"].dims, no2, {"units": "molecules/cm^2", "long_name": "Tropospheric vertical column of Nitrogen Dioxide"})
 
     base_filename = f"NO2_Indonesia_Daily_{date_str.replace('-','')}"
     final_filename = os.path.join("nc", f"{base_filename}_{method}.nc")
     print(f"\n🔄 Preparing final data for method: '{method}'...")
-    if os.path.exists(final_filename): os.remove(final_filename)
-    create_netcdf_manually(final_filename, ds, date_str)
+    # Build into a .part file and move it into place, so an interrupted run never leaves a
+    # truncated final file that the early "already exist" check would accept
+    partial_filename = final_filename + ".part"
+    if os.path.exists(partial_filename): os.remove(partial_filename)
+    create_netcdf_manually(partial_filename, ds, days_since_epoch)
+    os.replace(partial_filename, final_filename)
     return final_filename
 
 def main():
     """Main function to orchestrate the entire workflow."""
     start_time = time.time()
     
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    final_files = [os.path.join("nc", f"NO2_Indonesia_Daily_{date_str.replace('-', '')}_{method}.nc")
+                   for method in ("original", "linear_interp", "cubic_interp")]
+    if all(os.path.exists(f) for f in final_files):
+        print(f"✅ Final files for {date_str} already exist. Nothing to do.")
+        return
+
     # --- 1. Download and Merge ---
     connection = openeo.connect("openeo.dataspace.copernicus.eu").authenticate_oidc()
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    grid_boxes = generate_grid_boxes({"west": 95.0, "east": 141.0, "south": -11.0, "north": 6.0}, {"x": 5, "y": 2})
+    # Time coordinate shared by every output file, computed once per run
+    days_since_epoch = int((np.datetime64(date_str) - np.datetime64("1970-01-01")).astype(int))
+    grid_boxes = generate_grid_boxes(INDONESIA_EXTENT, GRID_DIVISIONS)
     
+    # Submit all boxes at once: each openEO job is an I/O-bound wait on the backend
     box_files = []
-    for name, extent in grid_boxes.items():
-        success = False
-        while not success:
+    with ThreadPoolExecutor(max_workers=len(grid_boxes)) as executor:
+        futures = {
+            executor.submit(process_box_with_retry, connection, date_str, name, extent): name
+            for name, extent in grid_boxes.items()
+        }
+        for future in as_completed(futures):
             try:
-                box_files.append(process_box(connection, date_str, date_str, name, extent))
-                success = True
+                box_files.append(future.result())
             except Exception as e:
-                print(f"   ❌ Failed to process {name}: {e}")
-                print(f"   🔁 Retrying download for {name}...")
-                time.sleep(5)  # Wait 5 seconds before retrying
+                print(f"   ❌ Failed to process {futures[future]}: {e}")
 
     if not box_files:
         print("\n❌ No data downloaded. Exiting."); return
@@ -149,30 +226,39 @@ def main():
 
     # --- 2. Process, Interpolate, and Save ---
     print(f"\n🔄 Processing {merged_file}...")
-    ds_full = xr.open_dataset(merged_file)
-    ds = ds_full[['NO2']].copy(); ds_full.close()
+    with xr.open_dataset(merged_file) as ds_full:
+        ds = ds_full[['NO2']].load()
 
-    _, index = np.unique(ds['y'], return_index=True); ds = ds.isel(y=index).sortby('y')
-    _, index = np.unique(ds['x'], return_index=True); ds = ds.isel(x=index).sortby('x')
+    # np.unique returns first occurrences in ascending order, so one isel both dedups and sorts;
+    # it is skipped entirely when the axes are already strictly increasing
+    y, x = ds['y'].values, ds['x'].values
+    if not (np.all(np.diff(y) > 0) and np.all(np.diff(x) > 0)):
+        _, iy = np.unique(y, return_index=True)
+        _, ix = np.unique(x, return_index=True)
+        ds = ds.isel(y=iy, x=ix)
     print("   ✅ Coordinates cleaned and sorted.")
 
-    final_original_file = process_and_save_data(ds.copy(), date_str, method="original")
+    values = ds['NO2'].values
 
-    stacked = ds.stack(points=('y', 'x')).dropna(dim='points')
-    valid_points = np.vstack((stacked.y.values, stacked.x.values)).T
-    valid_values = stacked.NO2.values
-    grid_x, grid_y = np.meshgrid(ds.x.values, ds.y.values)
+    # A single background writer overlaps NetCDF output with the next gap fill.
+    # Writes stay serialized because the netCDF-C/HDF5 library is not thread-safe.
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        print("\n🔄 Filling data gaps on the regular grid (linear)...")
+        linear_values = fill_gaps(values, method="linear")
+        linear_ds = xr.Dataset({"NO2": (('y', 'x'), linear_values)}, coords={"y": ds.y.values, "x": ds.x.values})
+        linear_job = writer.submit(process_and_save_data, linear_ds, date_str, days_since_epoch, method="linear_interp")
 
-    print("\n🔄 Interpolating data with Scipy Griddata (linear)...")
-    griddata_linear = griddata(valid_points, valid_values, (grid_y, grid_x), method='linear')
-    linear_ds = xr.Dataset({"NO2": (('y', 'x'), griddata_linear)}, coords={"y": ds.y.values, "x": ds.x.values})
-    final_linear_file = process_and_save_data(linear_ds, date_str, method="linear_interp")
+        print("\n🔄 Filling data gaps on the regular grid (cubic)...")
+        cubic_values = fill_gaps(values, method="cubic")
+        cubic_ds = xr.Dataset({"NO2": (('y', 'x'), cubic_values)}, coords={"y": ds.y.values, "x": ds.x.values})
+        cubic_job = writer.submit(process_and_save_data, cubic_ds, date_str, days_since_epoch, method="cubic_interp")
 
-    print("\n🔄 Interpolating data with Scipy Griddata (cubic)...")
-    griddata_cubic = griddata(valid_points, valid_values, (grid_y, grid_x), method='cubic')
-    cubic_ds = xr.Dataset({"NO2": (('y', 'x'), griddata_cubic)}, coords={"y": ds.y.values, "x": ds.x.values})
-    final_cubic_file = process_and_save_data(cubic_ds, date_str, method="cubic_interp")
+        # Both fills have read the raw values, so the original can now be scaled in place
+        original_job = writer.submit(process_and_save_data, ds, date_str, days_since_epoch, method="original")
 
+        final_linear_file = linear_job.result()
+        final_cubic_file = cubic_job.result()
+        final_original_file = original_job.result()
     ds.close()
 
     # --- 3. Conclusion ---
@@ -6,23 +6,176 @@ Analisis lengkap dari citra satelit ke laporan teks dengan pemetaan geografis
 import os
 import sys
 import json
+import zipfile
 from datetime import datetime
+try:
+    import orjson  # Opsional: serialisasi laporan JSON yang lebih cepat
+except ImportError:
+    orjson = None
 import numpy as np
 from PIL import Image
+from scipy.spatial import cKDTree
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 
+# Bounds tepat citra Java: 104.5E, 115E, 9S, 5S
+MIN_LON, MAX_LON = 104.5, 115.0
+MIN_LAT, MAX_LAT = -9.0, -5.0
+
+# Batas kabupaten/kota nasional; fitur Jawa di-cache ke file .npz di sampingnya
+GEOJSON_PATH = "indonesia_kabkota_38prov.geojson"
+JAVA_PROVINCES = [
+    "DKI JAKARTA", "JAWA BARAT", "JAWA TENGAH", 
+    "DI YOGYAKARTA", "JAWA TIMUR", "BANTEN"
+]
+
+def _ring_array(coords):
+    """Ubah ring GeoJSON menjadi array (n+1, 2) float64 dengan titik pertama diulang di akhir"""
+    ring = np.array([c[:2] for c in coords], dtype=np.float64)
+    return np.vstack([ring, ring[:1]])
+
+def _pip(x, y, ring):
+    """Ray casting ter-vektorisasi atas semua sisi ring dari _ring_array"""
+    p1x, p1y = ring[:-1, 0], ring[:-1, 1]
+    p2x, p2y = ring[1:, 0], ring[1:, 1]
+    # Sisi horizontal tidak pernah lolos syarat ini, jadi pembagian di bawah aman
+    crossing = (y > np.minimum(p1y, p2y)) & (y <= np.maximum(p1y, p2y))
+    if not crossing.any():
+        return False
+    p1x, p1y, p2x, p2y = p1x[crossing], p1y[crossing], p2x[crossing], p2y[crossing]
+    xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+    return bool(np.count_nonzero(x <= xinters) % 2)
+
+def pip_batch(points_xy, ring):
+    """Ray casting untuk M titik (M, 2) terhadap satu ring sekaligus; mengembalikan mask boolean (M,)"""
+    x = points_xy[:, 0:1]
+    y = points_xy[:, 1:2]
+    p1x, p1y = ring[:-1, 0], ring[:-1, 1]
+    p2x, p2y = ring[1:, 0], ring[1:, 1]
+    # Aturan sisi sama dengan _pip: min(p1y, p2y) < y <= max(p1y, p2y)
+    crossing = (p1y < y) != (p2y < y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+    return np.count_nonzero(crossing & (x <= xinters), axis=1) % 2 == 1
+
+def _set_rings(feature, rings):
+    """Simpan ring luar fitur sebagai daftar array seragam beserta bounding box tiap ring"""
+    feature['_rings'] = rings
+    feature['_ring_bboxes'] = np.array(
+        [(*ring.min(axis=0), *ring.max(axis=0)) for ring in rings], dtype=np.float64
+    ).reshape(-1, 4)
+
+def _feature_bbox(feature):
+    """Bounding box (min_lon, min_lat, max_lon, max_lat) dari semua ring sebuah fitur"""
+    ring_bboxes = feature['_ring_bboxes']
+    if len(ring_bboxes) == 0:
+        return (np.nan,) * 4
+    return (*ring_bboxes[:, :2].min(axis=0), *ring_bboxes[:, 2:].max(axis=0))
+
+def _filter_java_features(full_data, java_provinces):
+    """Pilih fitur kabupaten/kota di Jawa dan siapkan ring luarnya sebagai array NumPy"""
+    java_features = []
+    for feature in full_data['features']:
+        provinsi = feature['properties'].get('provinsi', '').upper()
+        if any(java_prov in provinsi for java_prov in java_provinces):
+            # Ring luar disiapkan sekali sebagai array NumPy untuk point-in-polygon;
+            # Polygon dan MultiPolygon sama-sama menjadi daftar ring
+            geometry = feature['geometry']
+            if geometry['type'] == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry['type'] == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                polygons = []
+            _set_rings(feature, [_ring_array(polygon[0]) for polygon in polygons])
+            java_features.append(feature)
+    return java_features
+
+def java_cache_path(geojson_path):
+    """Lokasi cache .npz fitur Jawa untuk sebuah file GeoJSON"""
+    return os.path.splitext(geojson_path)[0] + '_jawa.npz'
+
+def build_java_cache(geojson_path, java_provinces=JAVA_PROVINCES, cache_path=None):
+    """Parse GeoJSON nasional sekali, filter Jawa, lalu simpan ring dan nama wilayah ke .npz"""
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        full_data = json.load(f)
+    java_features = _filter_java_features(full_data, java_provinces)
+    
+    # Semua ring dipadatkan ke satu array koordinat dengan offset per ring
+    rings, ring_feature = [], []
+    for idx, feature in enumerate(java_features):
+        for ring in feature['_rings']:
+            rings.append(ring)
+            ring_feature.append(idx)
+    
+    cache_path = cache_path or java_cache_path(geojson_path)
+    try:
+        # Ditulis ke file sementara dulu agar cache yang setengah jadi tidak pernah terbaca
+        with open(cache_path + '.tmp', 'wb') as f:
+            np.savez(
+                f,
+                provinces=np.array(java_provinces),
+                geometry_type=np.array([feat['geometry']['type'] for feat in java_features], dtype=str),
+                kabupaten=np.array([feat['properties'].get('kabupaten', 'Unknown') for feat in java_features], dtype=str),
+                provinsi=np.array([feat['properties'].get('provinsi', 'Unknown') for feat in java_features], dtype=str),
+                coords=np.concatenate(rings) if rings else np.empty((0, 2)),
+                offsets=np.cumsum([0] + [len(ring) for ring in rings]).astype(np.int64),
+                ring_feature=np.array(ring_feature, dtype=np.int32)
+            )
+        os.replace(cache_path + '.tmp', cache_path)
+        print(f"💾 Cache GeoJSON Jawa disimpan: {cache_path}")
+    except OSError as e:
+        print(f"⚠️  Warning: Tidak dapat menyimpan cache GeoJSON: {e}")
+    return java_features
+
+def load_java_cache(cache_path, java_provinces=JAVA_PROVINCES):
+    """Baca fitur Jawa dari cache .npz; None jika cache dibuat untuk daftar provinsi lain
+    atau tidak dapat dibaca (terpotong, rusak, atau skema lama), sehingga cache dibuat ulang"""
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if cache['provinces'].tolist() != list(java_provinces):
+                return None
+            geometry_types = cache['geometry_type'].tolist()
+            kabupaten = cache['kabupaten'].tolist()
+            provinsi = cache['provinsi'].tolist()
+            coords = cache['coords']
+            offsets = cache['offsets'].tolist()
+            ring_feature = cache['ring_feature'].tolist()
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+        print(f"⚠️  Warning: Cache GeoJSON tidak dapat dibaca, dibuat ulang: {e}")
+        return None
+    
+    java_features = [
+        {'type': 'Feature', 'geometry': {'type': geom_type}, 'properties': {'kabupaten': kab, 'provinsi': prov}}
+        for geom_type, kab, prov in zip(geometry_types, kabupaten, provinsi)
+    ]
+    feature_rings = [[] for _ in java_features]
+    for i, idx in enumerate(ring_feature):
+        feature_rings[idx].append(coords[offsets[i]:offsets[i + 1]])
+    for feature, rings in zip(java_features, feature_rings):
+        _set_rings(feature, rings)
+    return java_features
+
+def _panel_view(arr, max_size=1000):
+    """Subsample citra besar untuk panel figure, beserta extent agar sumbu tetap dalam koordinat pixel asli"""
+    height, width = arr.shape[:2]
+    stride = max(1, -(-max(height, width) // max_size))
+    return arr[::stride, ::stride], (-0.5, width - 0.5, height - 0.5, -0.5)
+
 class TropomiAnalyzerGeo:
     """TROPOMI NO2 Analyzer dengan integrasi geografis"""
     def __init__(self, geojson_path=None):
         self.image = None
         self.concentration_map = None
         self.geojson_data = None
-        self.java_provinces = [
-            "DKI JAKARTA", "JAWA BARAT", "JAWA TENGAH", 
-            "DI YOGYAKARTA", "JAWA TIMUR", "BANTEN"
-        ]
+        self._bboxes = np.empty((0, 4))
+        self._centroids = np.empty((0, 2))
+        self._centroid_features = []
+        self._kdtree = None
+        self._loc_cache = {}
+        self._reset_results()
+        self.java_provinces = list(JAVA_PROVINCES)
         
         if geojson_path and os.path.exists(geojson_path):
             self.load_and_filter_geojson(geojson_path)
@@ -30,20 +183,26 @@ class TropomiAnalyzerGeo:
     def load_and_filter_geojson(self, geojson_path):
         """Memuat GeoJSON dan filter hanya untuk Jawa"""
         try:
-            with open(geojson_path, 'r', encoding='utf-8') as f:
-                full_data = json.load(f)
-            
-            # Filter hanya kabupaten/kota di Jawa
-            java_features = []
-            for feature in full_data['features']:
-                provinsi = feature['properties'].get('provinsi', '').upper()
-                if any(java_prov in provinsi for java_prov in self.java_provinces):
-                    java_features.append(feature)
+            # Pakai cache .npz bila lebih baru dari GeoJSON; jika tidak, parse ulang dan buat cache
+            cache_path = java_cache_path(geojson_path)
+            java_features = None
+            if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(geojson_path):
+                java_features = load_java_cache(cache_path, self.java_provinces)
+            if java_features is None:
+                java_features = build_java_cache(geojson_path, self.java_provinces, cache_path)
             
+            self._loc_cache = {}
             self.geojson_data = {
                 'type': 'FeatureCollection',
                 'features': java_features
             }
+            # Indeks bounding box untuk menyaring kandidat sebelum uji point-in-polygon
+            self._bboxes = np.array([_feature_bbox(f) for f in java_features], dtype=np.float64).reshape(-1, 4)
+            # Centroid (rata-rata titik ring luar) fitur Polygon untuk pencarian region terdekat
+            self._centroid_features = [f for f in java_features if f['geometry']['type'] == 'Polygon']
+            self._centroids = np.array([f['_rings'][0][:-1].mean(axis=0) for f in self._centroid_features],
+                                       dtype=np.float64).reshape(-1, 2)
+            self._kdtree = cKDTree(self._centroids) if len(self._centroids) else None
             
             print(f"✅ GeoJSON dimuat: {len(java_features)} kabupaten/kota di Jawa")
             return True
@@ -54,85 +213,114 @@ class TropomiAnalyzerGeo:
     
     def pixel_to_coordinates(self, pixel_x, pixel_y):
         """Konversi pixel ke koordinat geografis - bounds tepat Java"""
-        # Bounds tepat: 104.5E, 115E, 9S, 5S
-        min_lon, max_lon = 104.5, 115.0
-        min_lat, max_lat = -9.0, -5.0
-        
         height, width = self.image.shape[:2]
         
-        lon = min_lon + (pixel_x / width) * (max_lon - min_lon)
-        lat = max_lat - (pixel_y / height) * (max_lat - min_lat)
+        lon = MIN_LON + (pixel_x / width) * (MAX_LON - MIN_LON)
+        lat = MAX_LAT - (pixel_y / height) * (MAX_LAT - MIN_LAT)
         
         return lon, lat
     
+    def pixels_to_coordinates(self, xs, ys):
+        """Versi array dari pixel_to_coordinates untuk banyak pixel sekaligus"""
+        return MIN_LON + np.asarray(xs) * self._lon_per_px, MAX_LAT - np.asarray(ys) * self._lat_per_px
+    
     def point_in_polygon(self, x, y, polygon):
         """Ray casting algorithm untuk point-in-polygon"""
-        n = len(polygon)
-        inside = False
-        
-        p1x, p1y = polygon[0][:2]
-        for i in range(1, n + 1):
-            p2x, p2y = polygon[i % n][:2]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        
-        return inside
+        if not isinstance(polygon, np.ndarray):
+            polygon = _ring_array(polygon)
+        return _pip(x, y, polygon)
     
     def find_location_name(self, lon, lat):
         """Temukan nama kabupaten/kota berdasarkan koordinat"""
+        # Hasil di-cache per sel grid 0.01 derajat (~1 km); hotspot yang berdekatan memakai hasil yang sama
+        key = (int(lon * 100), int(lat * 100))
+        if key not in self._loc_cache:
+            self._loc_cache[key] = self._locate(lon, lat)
+        return self._loc_cache[key]
+    
+    def _locate(self, lon, lat):
+        """Pencarian lokasi tanpa cache: exact match lalu region terdekat"""
         if not self.geojson_data:
             return None
         
-        # Coba exact match dulu
-        for feature in self.geojson_data['features']:
-            geometry = feature['geometry']
+        # Coba exact match dulu, hanya pada fitur yang bounding box-nya memuat titik
+        features = self.geojson_data['features']
+        bb = self._bboxes
+        candidates = np.flatnonzero((bb[:, 0] <= lon) & (lon <= bb[:, 2]) & (bb[:, 1] <= lat) & (lat <= bb[:, 3]))
+        for idx in candidates:
+            feature = features[idx]
+            rings = feature['_rings']
+            rb = feature['_ring_bboxes']
+            # Saring lagi per ring dengan bounding box-nya sebelum uji ray casting
+            in_ring_box = (rb[:, 0] <= lon) & (lon <= rb[:, 2]) & (rb[:, 1] <= lat) & (lat <= rb[:, 3])
+            if any(_pip(lon, lat, rings[r]) for r in np.flatnonzero(in_ring_box)):
+                properties = feature['properties']
+                return {
+                    'kabupaten': properties.get('kabupaten', 'Unknown'),
+                    'provinsi': properties.get('provinsi', 'Unknown')
+                }
+        
+        return self._nearest_location(lon, lat)
+    
+    def find_location_names(self, lons, lats):
+        """Versi batch find_location_name dengan cache grid yang sama"""
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        keys = list(zip((lons * 100).astype(int).tolist(), (lats * 100).astype(int).tolist()))
+        missing = np.array([key not in self._loc_cache for key in keys], dtype=bool)
+        if missing.any():
+            found = self._locate_many(lons[missing], lats[missing])
+            for i, location in zip(np.flatnonzero(missing), found):
+                self._loc_cache.setdefault(keys[i], location)
+        return [self._loc_cache[key] for key in keys]
+    
+    def _locate_many(self, lons, lats):
+        """Tiap fitur diuji sekali untuk semua titik yang belum terpetakan"""
+        results = [None] * len(lons)
+        if not self.geojson_data:
+            return results
+        
+        points = np.column_stack([lons, lats])
+        unresolved = np.ones(len(points), dtype=bool)
+        bb = self._bboxes
+        # Fitur diuji sesuai urutan aslinya, jadi setiap titik tetap mendapat fitur pertama yang memuatnya
+        for idx, feature in enumerate(self.geojson_data['features']):
+            ids = np.flatnonzero(unresolved & (bb[idx, 0] <= lons) & (lons <= bb[idx, 2])
+                                 & (bb[idx, 1] <= lats) & (lats <= bb[idx, 3]))
+            if len(ids) == 0:
+                continue
+            inside = np.zeros(len(ids), dtype=bool)
+            for ring in feature['_rings']:
+                inside |= pip_batch(points[ids], ring)
             properties = feature['properties']
-            
-            if geometry['type'] == 'Polygon':
-                if self.point_in_polygon(lon, lat, geometry['coordinates'][0]):
-                    return {
-                        'kabupaten': properties.get('kabupaten', 'Unknown'),
-                        'provinsi': properties.get('provinsi', 'Unknown')
-                    }
-            elif geometry['type'] == 'MultiPolygon':
-                for polygon in geometry['coordinates']:
-                    if self.point_in_polygon(lon, lat, polygon[0]):
-                        return {
-                            'kabupaten': properties.get('kabupaten', 'Unknown'),
-                            'provinsi': properties.get('provinsi', 'Unknown')
-                        }
+            for i in ids[inside]:
+                results[i] = {
+                    'kabupaten': properties.get('kabupaten', 'Unknown'),
+                    'provinsi': properties.get('provinsi', 'Unknown')
+                }
+            unresolved[ids[inside]] = False
+            if not unresolved.any():
+                break
         
+        for i in np.flatnonzero(unresolved):
+            results[i] = self._nearest_location(float(lons[i]), float(lats[i]))
+        return results
+    
+    def _nearest_location(self, lon, lat):
+        """Nama perairan atau kabupaten/kota terdekat untuk titik tanpa exact match"""
         # Jika tidak ditemukan exact match, tentukan apakah di laut atau cari yang terdekat
         nearest_region = None
         min_distance = float('inf')
         
-        for feature in self.geojson_data['features']:
-            geometry = feature['geometry']
-            properties = feature['properties']
-            
-            # Hitung jarak ke centroid region
-            if geometry['type'] == 'Polygon':
-                coords = geometry['coordinates'][0]
-                lons = [c[0] for c in coords]
-                lats = [c[1] for c in coords]
-                center_lon = sum(lons) / len(lons)
-                center_lat = sum(lats) / len(lats)
-                
-                distance = ((lon - center_lon)**2 + (lat - center_lat)**2)**0.5
-                
-                # Simpan region terdekat
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_region = {
-                        'kabupaten': f"{properties.get('kabupaten', 'Unknown')} (terdekat)",
-                        'provinsi': properties.get('provinsi', 'Unknown')
-                    }
+        # Cari centroid region terdekat lewat KD-tree dan simpan region terdekat
+        if self._kdtree is not None:
+            distance, i = self._kdtree.query([lon, lat], k=1)
+            min_distance = float(distance)
+            properties = self._centroid_features[i]['properties']
+            nearest_region = {
+                'kabupaten': f"{properties.get('kabupaten', 'Unknown')} (terdekat)",
+                'provinsi': properties.get('provinsi', 'Unknown')
+            }
         
         # Logika untuk menentukan apakah di laut atau daratan
         # Jika jarak ke daratan terdekat > 0.3 derajat (~33km), anggap sebagai laut terbuka
@@ -162,11 +350,25 @@ class TropomiAnalyzerGeo:
         # Jika dekat daratan (< 0.3 derajat), gunakan region terdekat
         return nearest_region
     
+    def _reset_results(self):
+        """Kosongkan hasil analisis yang di-cache; dipanggil setiap citra atau peta konsentrasi berubah"""
+        self._hotspots = {}
+        self._stats = None
+        self._wind = None
+    
     def load_image(self, image_path):
         """Memuat citra satelit"""
-        self.image = np.array(Image.open(image_path))
-        if len(self.image.shape) == 3 and self.image.shape[2] == 4:
-            self.image = self.image[:, :, :3]
+        img = Image.open(image_path)
+        img.draft('RGB', img.size)
+        # convert('RGB') membuang kanal alpha saat decode, jadi tidak ada salinan RGBA penuh
+        img = img.convert('RGB')
+        self.image = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(img.size[1], img.size[0], 3)
+        # Skala derajat per pixel untuk konversi koordinat secara batch
+        height, width = self.image.shape[:2]
+        self._lon_per_px = (MAX_LON - MIN_LON) / width
+        self._lat_per_px = (MAX_LAT - MIN_LAT) / height
+        self.concentration_map = None
+        self._reset_results()
         print(f"📷 Citra dimuat: {self.image.shape}")
         return self.image
     
@@ -175,108 +377,133 @@ class TropomiAnalyzerGeo:
         height, width = self.image.shape[:2]
         map_area = self.image[:int(height * 0.85), :]
         
-        red = map_area[:, :, 0].astype(float)
-        green = map_area[:, :, 1].astype(float)
-        blue = map_area[:, :, 2].astype(float)
-        
-        # Klasifikasi warna NO2
+        # View kanal uint8 langsung, tanpa konversi ke float
+        red = map_area[:, :, 0]
+        green = map_area[:, :, 1]
+        blue = map_area[:, :, 2]
+
+        # Klasifikasi warna NO2 (kelas saling lepas, jadi urutan tidak berpengaruh)
         blue_areas = (blue > 150) & (red < 100) & (green < 150)
         green_areas = (green > 150) & (red < 150) & (blue < 100)
         yellow_areas = (red > 150) & (green > 150) & (blue < 100)
         red_areas = (red > 150) & (green < 100) & (blue < 100)
-        
-        self.concentration_map = np.zeros(map_area.shape[:2])
-        self.concentration_map[blue_areas] = 5
-        self.concentration_map[green_areas] = 10
-        self.concentration_map[yellow_areas] = 20
-        self.concentration_map[red_areas] = 30
-        
+
+        self.concentration_map = np.select(
+            [blue_areas, green_areas, yellow_areas, red_areas],
+            np.array([5, 10, 20, 30], dtype=np.uint8),
+            default=0
+        )
+        self._reset_results()
+
         return self.concentration_map
     
     def detect_hotspots(self, threshold=15):
         """Deteksi hotspot dengan pemetaan geografis"""
         if self.concentration_map is None:
             self.extract_concentration_data()
+        if threshold in self._hotspots:
+            return self._hotspots[threshold]
         
         high_conc_mask = self.concentration_map > threshold
         hotspots = []
         
         height, width = self.concentration_map.shape
         step = 15
-        
-        for y in range(0, height, step):
-            for x in range(0, width, step):
-                if high_conc_mask[y, x]:
-                    lon, lat = self.pixel_to_coordinates(x, y)
-                    location = self.find_location_name(lon, lat)
-                    
-                    # Hitung konsentrasi area
-                    y_start = max(0, y - step//2)
-                    y_end = min(height, y + step//2)
-                    x_start = max(0, x - step//2)
-                    x_end = min(width, x + step//2)
-                    
-                    area_data = self.concentration_map[y_start:y_end, x_start:x_end]
-                    avg_conc = np.mean(area_data[area_data > 0])
-                    max_conc = np.max(area_data)
-                    
-                    if max_conc > threshold:
-                        hotspot = {
-                            'id': len(hotspots) + 1,
-                            'centroid': [int(x), int(y)],  # Format kompatibel dengan report generator
-                            'pixel_coordinates': (x, y),
-                            'geo_coordinates': (lon, lat),
-                            'max_concentration': float(max_conc),
-                            'avg_concentration': float(avg_conc),
-                            'area_pixels': step * step,
-                            'location': location
-                        }
-                        
-                        # Hindari duplikasi lokasi
-                        if location and location.get('kabupaten'):
-                            kabupaten = location['kabupaten']
-                            duplicate = False
-                            for h in hotspots:
-                                h_location = h.get('location')
-                                if h_location and h_location.get('kabupaten') == kabupaten:
-                                    duplicate = True
-                                    break
-                            if not duplicate:
-                                hotspots.append(hotspot)
-                        else:
-                            hotspots.append(hotspot)
+        half = step // 2
+        
+        # Titik grid yang melewati threshold, dalam urutan baris seperti pemindaian semula
+        centers = np.argwhere(high_conc_mask[::step, ::step])
+        
+        # Jendela [y-half, y+half) x [x-half, x+half) tiap titik terpilih diambil sekaligus:
+        # peta diberi padding nol (tidak mengubah max maupun piksel > 0) lalu dipotong per blok step x step
+        ny, nx = -(-height // step), -(-width // step)
+        padded = np.zeros((ny * step, nx * step), dtype=self.concentration_map.dtype)
+        padded[half:half + height, half:half + width] = self.concentration_map[:ny * step - half, :nx * step - half]
+        blocks = padded.reshape(ny, step, nx, step)[centers[:, 0], :2 * half, centers[:, 1], :2 * half]
+        tile_max = blocks.max(axis=(1, 2))
+        tile_sum = blocks.sum(axis=(1, 2), dtype=np.int32)
+        tile_nz = np.count_nonzero(blocks > 0, axis=(1, 2))
+        tile_avg = tile_sum / np.maximum(tile_nz, 1)
+        
+        lons, lats = self.pixels_to_coordinates(centers[:, 1] * step, centers[:, 0] * step)
+        locations = self.find_location_names(lons, lats)
+        for i, ((ty, tx), lon, lat, location) in enumerate(zip(centers, lons.tolist(), lats.tolist(), locations)):
+            x, y = int(tx) * step, int(ty) * step
+            max_conc = tile_max[i]
+            if max_conc > threshold:
+                hotspot = {
+                    'id': len(hotspots) + 1,
+                    'centroid': [x, y],  # Format kompatibel dengan report generator
+                    'pixel_coordinates': (x, y),
+                    'geo_coordinates': (lon, lat),
+                    'max_concentration': float(max_conc),
+                    'avg_concentration': float(tile_avg[i]),
+                    'area_pixels': step * step,
+                    'location': location
+                }
+                
+                # Hindari duplikasi lokasi
+                if location and location.get('kabupaten'):
+                    kabupaten = location['kabupaten']
+                    duplicate = False
+                    for h in hotspots:
+                        h_location = h.get('location')
+                        if h_location and h_location.get('kabupaten') == kabupaten:
+                            duplicate = True
+                            break
+                    if not duplicate:
+                        hotspots.append(hotspot)
+                else:
+                    hotspots.append(hotspot)
         
         hotspots.sort(key=lambda x: x['max_concentration'], reverse=True)
+        self._hotspots[threshold] = hotspots
         return hotspots
     
     def calculate_statistics(self):
         """Hitung statistik konsentrasi"""
         if self.concentration_map is None:
             self.extract_concentration_data()
-        
-        valid_data = self.concentration_map[self.concentration_map > 0]
-        
-        if len(valid_data) == 0:
-            return {}
-        
-        return {
-            'total_pixels_analyzed': len(valid_data),
-            'max_concentration': float(np.max(valid_data)),
-            'min_concentration': float(np.min(valid_data)),
-            'mean_concentration': float(np.mean(valid_data)),
-            'median_concentration': float(np.median(valid_data)),
-            'std_concentration': float(np.std(valid_data)),
+        if self._stats is not None:
+            return self._stats
+        
+        # Peta hanya berisi beberapa nilai bulat kecil, jadi semua statistik dihitung dari satu histogram
+        counts = np.bincount(self.concentration_map.ravel(), minlength=31)
+        counts[0] = 0
+        n = int(counts.sum())
+        
+        if n == 0:
+            self._stats = {}
+            return self._stats
+        
+        values = np.arange(len(counts), dtype=np.float64)
+        present = np.flatnonzero(counts)
+        mean = float(np.dot(values, counts) / n)
+        # Median dari posisi tengah data terurut, dibaca lewat jumlah kumulatif histogram
+        cumulative = np.cumsum(counts)
+        middle = np.searchsorted(cumulative, [(n - 1) // 2, n // 2], side='right')
+        
+        self._stats = {
+            'total_pixels_analyzed': n,
+            'max_concentration': float(present[-1]),
+            'min_concentration': float(present[0]),
+            'mean_concentration': mean,
+            'median_concentration': float(values[middle].mean()),
+            'std_concentration': float(np.sqrt(np.dot(counts, (values - mean) ** 2) / n)),
             'coverage': {
-                'low_pollution': float(np.sum(valid_data <= 8) / len(valid_data) * 100),
-                'moderate_pollution': float(np.sum((valid_data > 8) & (valid_data <= 20)) / len(valid_data) * 100),
-                'high_pollution': float(np.sum(valid_data > 20) / len(valid_data) * 100)
+                'low_pollution': float(counts[:9].sum() / n * 100),
+                'moderate_pollution': float(counts[9:21].sum() / n * 100),
+                'high_pollution': float(counts[21:].sum() / n * 100)
             }
         }
+        return self._stats
     
     def analyze_wind_patterns(self):
         """Analisis pola angin dari orientasi plume"""
         if self.concentration_map is None:
             self.extract_concentration_data()
+        if self._wind is not None:
+            return self._wind
         
         # Simulasi analisis angin - implementasi sederhana
         wind_patterns = []
@@ -288,30 +515,40 @@ class TropomiAnalyzerGeo:
                 'confidence': 'medium'
             })
         
+        self._wind = wind_patterns
         return wind_patterns
     
-    def create_analysis_visualization(self, output_path='visualisasi_analisis.png'):
+    def create_analysis_visualization(self, output_path='visualisasi_analisis.png', hotspots=None, stats=None):
         """Buat visualisasi analisis"""
         if self.concentration_map is None:
             self.extract_concentration_data()
+        if hotspots is None:
+            hotspots = self.detect_hotspots()
+        if stats is None:
+            stats = self.calculate_statistics()
         
         fig, axes = plt.subplots(2, 2, figsize=(15, 12))
         fig.suptitle('TROPOMI NO2 - Analisis Geografis Java', fontsize=16, fontweight='bold')
         
+        # Panel raster hanya perlu resolusi sebesar panelnya pada dpi output, jadi citra besar
+        # di-subsample dulu; extent menjaga koordinat pixel asli untuk penanda hotspot
+        image_view, image_extent = _panel_view(self.image)
+        conc_view, conc_extent = _panel_view(self.concentration_map)
+        
         # Original image
-        axes[0, 0].imshow(self.image)
+        axes[0, 0].imshow(image_view, extent=image_extent, interpolation='nearest')
         axes[0, 0].set_title('Citra Satelit Asli')
         axes[0, 0].axis('off')
         
         # Concentration map
-        im = axes[0, 1].imshow(self.concentration_map, cmap='YlOrRd', vmin=0, vmax=30)
+        im = axes[0, 1].imshow(conc_view, extent=conc_extent, interpolation='nearest', cmap='YlOrRd', vmin=0, vmax=30)
         axes[0, 1].set_title('Peta Konsentrasi NO2')
         axes[0, 1].axis('off')
         plt.colorbar(im, ax=axes[0, 1], label='NO2 (×10¹⁵ molekul/cm²)')
         
         # Hotspot detection
-        hotspots = self.detect_hotspots()
-        axes[1, 0].imshow(self.concentration_map, cmap='YlOrRd', alpha=0.7)
+        axes[1, 0].imshow(conc_view, extent=conc_extent, interpolation='nearest', cmap='YlOrRd', alpha=0.7,
+                          vmin=self.concentration_map.min(), vmax=self.concentration_map.max())
         for i, hotspot in enumerate(hotspots[:10]):  # Show top 10
             x, y = hotspot['centroid']
             axes[1, 0].scatter(x, y, c='red', s=100, marker='x')
@@ -327,7 +564,6 @@ class TropomiAnalyzerGeo:
         axes[1, 0].axis('off')
         
         # Statistics
-        stats = self.calculate_statistics()
         stats_text = f"""Statistik Analisis:
         
 Max Konsentrasi: {stats['max_concentration']:.2f}
@@ -348,17 +584,20 @@ dengan Lokasi: {len([h for h in hotspots if h.get('location')])}"""
         axes[1, 1].axis('off')
         
         plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        plt.savefig(output_path, dpi=150, bbox_inches='tight')
         print(f"📊 Visualisasi disimpan: {output_path}")
         plt.close()
         
         return output_path
     
-    def generate_report(self, output_path='hasil_analisis.json'):
+    def generate_report(self, output_path='hasil_analisis.json', hotspots=None, stats=None, wind_patterns=None):
         """Generate laporan JSON"""
-        hotspots = self.detect_hotspots()
-        stats = self.calculate_statistics()
-        wind_patterns = self.analyze_wind_patterns()
+        if hotspots is None:
+            hotspots = self.detect_hotspots()
+        if stats is None:
+            stats = self.calculate_statistics()
+        if wind_patterns is None:
+            wind_patterns = self.analyze_wind_patterns()
         
         report = {
             'analysis_timestamp': datetime.now().isoformat(),
@@ -371,8 +610,12 @@ dengan Lokasi: {len([h for h in hotspots if h.get('location')])}"""
             'wind_patterns': wind_patterns
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
         
         print(f"💾 Laporan JSON disimpan: {output_path}")
         return report
@@ -389,7 +632,7 @@ def analisis_lengkap(path_citra):
         print(f"📷 Memuat citra: {path_citra}")
 
         # Path ke GeoJSON
-        geojson_path = "indonesia_kabkota_38prov.geojson"
+        geojson_path = GEOJSON_PATH
 
         # Langkah 1: Analisis citra dengan pemetaan geografis
         analyzer = TropomiAnalyzerGeo(geojson_path)
@@ -405,9 +648,9 @@ def analisis_lengkap(path_citra):
 
         print("💾 Menyimpan hasil analisis...")
         laporan_json_path = f"json/hasil_analisis_{today}.json"
-        analyzer.generate_report(laporan_json_path)
+        analyzer.generate_report(laporan_json_path, hotspots, stats, wind_patterns)
         vis_path = f"png/visualisasi_analisis_{today}.png"
-        analyzer.create_analysis_visualization(vis_path)
+        analyzer.create_analysis_visualization(vis_path, hotspots=hotspots, stats=stats)
 
         # Langkah 2: Buat laporan Bahasa Indonesia dengan lokasi geografis
         print("📝 Membuat laporan geografis Bahasa Indonesia...")
@@ -507,6 +750,10 @@ def main():
     print("🇮🇩 SISTEM ANALISIS TROPOMI NO2 - BAHASA INDONESIA")
     print("=" * 50)
     
+    if '--build-cache' in sys.argv[1:]:
+        build_java_cache(GEOJSON_PATH)
+        return
+    
     today = datetime.now().strftime('%Y%m%d')
     path_citra = f"png/NO2_Indonesia_Daily_{today}_linear_interp.png"
     if os.path.exists(path_citra):
@@ -515,6 +762,7 @@ def main():
         print(f"❌ Tidak ada file citra untuk hari ini: {path_citra}")
         print("\n📖 Contoh penggunaan:")
         print("   python3 04-quick-analysis.py")
+        print("   python3 04-quick-analysis.py --build-cache")
 
 if __name__ == "__main__":
     main()
@@ -31,37 +31,22 @@ def calculate_wind_data(ds):
     if 'forecast_period' in ds.dims:
         ds_surface = ds_surface.isel(forecast_period=0)
 
-    # Get coordinates and data
-    lats = ds_surface['latitude'].values
-    lons = ds_surface['longitude'].values
-    u_wind_full = ds_surface['u'].values
-    v_wind_full = ds_surface['v'].values
-    
     # Define bounding box for Java
     lat_min, lat_max = -9, -5
     lon_min, lon_max = 104.5, 115
     
-    # Find indices for the bounding box
-    lat_indices = np.where((lats >= lat_min) & (lats <= lat_max))[0]
-    lon_indices = np.where((lons >= lon_min) & (lons <= lon_max))[0]
+    # Label-based slicing reads only the regional block and works for either dimension order;
+    # the latitude slice is flipped when the axis is stored north-to-south
+    lats = ds_surface['latitude'].values
+    lat_slice = slice(lat_max, lat_min) if lats[0] > lats[-1] else slice(lat_min, lat_max)
+    ds_region = ds_surface[['u', 'v']].sel(latitude=lat_slice, longitude=slice(lon_min, lon_max))
     
-    if len(lat_indices) == 0 or len(lon_indices) == 0:
+    if ds_region.sizes['latitude'] == 0 or ds_region.sizes['longitude'] == 0:
         raise ValueError("❌ No data found within the specified bounding box.")
 
-    # Slice the data arrays to the bounding box
-    # Correctly handle cases where dimensions might be reversed (lat, lon) or (lon, lat)
-    if ds_surface['u'].dims == ('latitude', 'longitude'):
-        u_wind_regional = u_wind_full[lat_indices.min():lat_indices.max()+1, lon_indices.min():lon_indices.max()+1]
-        v_wind_regional = v_wind_full[lat_indices.min():lat_indices.max()+1, lon_indices.min():lon_indices.max()+1]
-    elif ds_surface['u'].dims == ('longitude', 'latitude'):
-        u_wind_regional = u_wind_full[lon_indices.min():lon_indices.max()+1, lat_indices.min():lat_indices.max()+1]
-        v_wind_regional = v_wind_full[lon_indices.min():lon_indices.max()+1, lat_indices.min():lat_indices.max()+1]
-    else:
-        raise ValueError(f"Unsupported dimension order: {ds_surface['u'].dims}")
-
     # Flatten the regional data
-    u_wind = u_wind_regional.flatten()
-    v_wind = v_wind_regional.flatten()
+    u_wind = ds_region['u'].values.ravel()
+    v_wind = ds_region['v'].values.ravel()
 
     # Remove NaN values to avoid errors in calculations
     valid_indices = ~np.isnan(u_wind) & ~np.isnan(v_wind)
@@ -69,11 +54,15 @@ def calculate_wind_data(ds):
     v_wind = v_wind[valid_indices]
 
     # Calculate wind speed (m/s)
-    wind_speed = np.sqrt(u_wind**2 + v_wind**2)
+    wind_speed = np.hypot(u_wind, v_wind)
     
     # Calculate wind direction (degrees)
-    # Converts from meteorological angle (where wind comes from)
-    wind_dir = (np.degrees(np.arctan2(-u_wind, -v_wind)) + 360) % 360
+    # Converts from meteorological angle (where wind comes from): the direction the wind
+    # blows towards plus 180 degrees, computed in place on a single output array
+    wind_dir = np.arctan2(u_wind, v_wind)
+    np.degrees(wind_dir, out=wind_dir)
+    wind_dir += 180
+    np.mod(wind_dir, 360, out=wind_dir)
     
     print(f"   ✅ Calculated speed and direction for {len(wind_speed)} data points within the region.")
     return wind_speed, wind_dir
@@ -105,12 +94,9 @@ def bin_wind_data(wind_speed, wind_dir):
     # Get the corresponding speed bin index for each data point
     speed_indices = np.digitize(wind_speed, bins=speed_bins) - 1
 
-    # Populate the binned_data table
-    for i in range(len(wind_speed)):
-        dir_idx = dir_indices[i]
-        speed_idx = speed_indices[i]
-        if 0 <= speed_idx < len(speed_labels):
-            binned_data[dir_idx, speed_idx] += 1
+    # Populate the binned_data table in one unbuffered scatter-add over the valid speed bins
+    valid = (speed_indices >= 0) & (speed_indices < len(speed_labels))
+    np.add.at(binned_data, (dir_indices[valid], speed_indices[valid]), 1)
             
     # Convert counts to percentages
     total_counts = np.sum(binned_data)
@@ -5,16 +5,23 @@
 Calculate NO2 regional averages for Java provinces and identify high pollution kabupaten/kota.
 Uses NetCDF files and Indonesian administrative shapefile to compute spatial averages.
 
-Required packages: pip install xarray geopandas numpy rasterio shapely
+Required packages: pip install xarray geopandas numpy scipy rasterio shapely
 """
 
 import os
 import sys
 import json
+try:
+    import orjson  # Optional: faster JSON serialization
+except ImportError:
+    orjson = None
 import xarray as xr
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+from affine import Affine
+from rasterio import features
+from scipy import ndimage
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
@@ -44,9 +51,6 @@ def load_administrative_shapefile():
     if not os.path.exists(geojson_path):
         raise FileNotFoundError(f"❌ GeoJSON file not found: {geojson_path}")
     
-    print(f"🗺️ Loading administrative GeoJSON: {geojson_path}")
-    gdf = gpd.read_file(geojson_path)
-    
     # Java provinces to extract (exact matches in uppercase)
     java_provinces = [
         "BANTEN",
@@ -62,12 +66,37 @@ def load_administrative_shapefile():
     
     print(f"   ✅ Using columns '{province_column}' and '{kabupaten_column}' for administrative units")
     
-    # Filter for Java provinces
-    java_gdf = gdf[gdf[province_column].isin(java_provinces)].copy()
-    
-    if len(java_gdf) == 0:
-        print("Available provinces:", sorted(gdf[province_column].unique()))
-        raise ValueError("❌ No Java provinces found in GeoJSON file")
+    # The Java subset is cached as a GeoPackage next to the GeoJSON; it is rebuilt whenever
+    # the GeoJSON is newer, so parsing the full 38-province file only happens once
+    cache_path = f"{os.path.splitext(geojson_path)[0]}_jawa.gpkg"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(geojson_path):
+        print(f"🗺️ Loading cached Java administrative boundaries: {cache_path}")
+        java_gdf = gpd.read_file(cache_path)
+    else:
+        print(f"🗺️ Loading administrative GeoJSON: {geojson_path}")
+        gdf = gpd.read_file(geojson_path)
+        
+        # Filter for Java provinces
+        java_gdf = gdf[gdf[province_column].isin(java_provinces)].copy()
+        
+        if len(java_gdf) == 0:
+            print("Available provinces:", sorted(gdf[province_column].unique()))
+            raise ValueError("❌ No Java provinces found in GeoJSON file")
+        
+        # Write to a temporary file first so an interrupted run never leaves a broken cache;
+        # the boundaries are already in memory, so a failed write only costs the cache
+        tmp_path = f"{os.path.splitext(cache_path)[0]}.tmp.gpkg"
+        try:
+            java_gdf.to_file(tmp_path, driver="GPKG")
+            os.replace(tmp_path, cache_path)
+            print(f"   💾 Cached Java boundaries to {cache_path}")
+        except Exception as e:
+            print(f"   ⚠️ Could not cache Java boundaries to {cache_path}: {e}")
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
     
     print(f"   ✅ Found {len(java_gdf)} kabupaten/kota in Java provinces:")
     for prov in java_provinces:
@@ -76,6 +105,17 @@ def load_administrative_shapefile():
     
     return java_gdf, province_column, kabupaten_column
 
+def coordinate_slice(coords, low, high):
+    """Index slice of a monotonic coordinate axis covering values in [low, high]."""
+    if coords[0] <= coords[-1]:
+        return slice(int(np.searchsorted(coords, low, side='left')),
+                     int(np.searchsorted(coords, high, side='right')))
+    # Descending axis (e.g. north-up latitudes): search the reversed view and map back
+    n = len(coords)
+    reversed_coords = coords[::-1]
+    return slice(n - int(np.searchsorted(reversed_coords, high, side='right')),
+                 n - int(np.searchsorted(reversed_coords, low, side='left')))
+
 def calculate_regional_data(ds, gdf, province_column, kabupaten_column):
     """Calculate NO2 data for provinces and identify high pollution kabupaten/kota."""
     print("\n🧮 Calculating regional data...")
@@ -102,23 +142,50 @@ def calculate_regional_data(ds, gdf, province_column, kabupaten_column):
     
     # Get 2D NO2 data
     if no2_data.ndim == 3:  # Has time dimension
-        no2_2d = no2_data[0].values  # Use first time slice
-    elif no2_data.ndim == 2:  # No time dimension
-        no2_2d = no2_data.values
-    else:
+        no2_data = no2_data[0]  # Use first time slice
+    elif no2_data.ndim != 2:
         raise ValueError(f"❌ Unexpected NO2 data dimensions: {no2_data.shape}")
     
     # Create affine transform
-    from affine import Affine
     # Correct pixel size calculation: n points define (n-1) intervals
-    pixel_width = (lons.max() - lons.min()) / (len(lons) - 1)
-    pixel_height = (lats.max() - lats.min()) / (len(lats) - 1)
+    pixel_width = (lons[-1] - lons[0]) / (len(lons) - 1)
+    pixel_height = (lats[-1] - lats[0]) / (len(lats) - 1)
+    
+    # The file covers all of Indonesia; only read the pixels inside the Java kabupaten/kota extent
+    min_lon, min_lat, max_lon, max_lat = gdf.total_bounds
+    lon_slice = coordinate_slice(lons, min_lon, max_lon)
+    lat_slice = coordinate_slice(lats, min_lat, max_lat)
+    if lon_slice.start >= lon_slice.stop or lat_slice.start >= lat_slice.stop:
+        raise ValueError("❌ NetCDF grid does not overlap the Java provinces")
+    lons, lats = lons[lon_slice], lats[lat_slice]
+    # float32 matches the 'f4' storage of the NetCDF and halves the memory traffic of the sweeps below;
+    # the labeled sums and means still accumulate in float64
+    no2_2d = no2_data[lat_slice, lon_slice].values.astype(np.float32, copy=False)
+    print(f"   ✂️ Cropped to Java extent: {len(lats)} x {len(lons)} points")
+    
+    # The NetCDF coordinates are pixel centres in array order, so the grid origin sits half a
+    # pixel before the first centre; a negative height covers north-up (descending) latitudes
+    transform = Affine(pixel_width, 0, lons[0] - pixel_width / 2,
+                       0, pixel_height, lats[0] - pixel_height / 2)
     
-    # Alternative method: Use rasterio.transform.from_bounds for accurate geospatial transform
-    # This is more reliable for satellite data with regular grids
-    from rasterio.transform import from_bounds
-    transform = from_bounds(lons.min(), lats.min(), lons.max(), lats.max(), 
-                          len(lons), len(lats))
+    # Burn every kabupaten/kota into one label raster (1-based, 0 = outside) in a single pass.
+    # Pixels are assigned by their centre like the previous point-in-polygon test, except that
+    # centres lying exactly on a polygon edge may be included by GDAL's rule, where the old
+    # strict contains() test excluded them.
+    kabupaten_labels = {idx: label for label, idx in enumerate(gdf.index, start=1)}
+    # Polygons whose bbox misses every pixel centre cannot own a pixel, so they are not burned
+    lon_min, lon_max = lons.min(), lons.max()
+    lat_min, lat_max = lats.min(), lats.max()
+    shapes = []
+    for idx, geom in zip(gdf.index, gdf.geometry):
+        if geom is None or geom.is_empty:
+            continue
+        b = geom.bounds
+        if b[2] < lon_min or b[0] > lon_max or b[3] < lat_min or b[1] > lat_max:
+            continue
+        shapes.append((geom, kabupaten_labels[idx]))
+    label_raster = features.rasterize(shapes, out_shape=no2_2d.shape, transform=transform,
+                                      fill=0, dtype='int32', all_touched=False)
     
     # Java provinces list
     java_provinces = [
@@ -130,6 +197,26 @@ def calculate_regional_data(ds, gdf, province_column, kabupaten_column):
         "JAWA TIMUR"
     ]
     
+    # Zonal statistics for every label in one sweep of the raster each.
+    # Kabupaten/kota statistics use all valid pixels; province totals only the non-negative ones.
+    label_ids = np.arange(1, len(gdf) + 1)
+    # One finite-value mask (drops NaN and ±inf) shared by both statistics
+    valid = np.isfinite(no2_2d)
+    no2_filled = np.where(valid, no2_2d, 0.0)
+    
+    kabupaten_label_raster = np.where(valid, label_raster, 0)
+    kabupaten_counts = np.bincount(kabupaten_label_raster.ravel(), minlength=len(gdf) + 1)[1:]
+    kabupaten_means = ndimage.mean(no2_filled, kabupaten_label_raster, label_ids)
+    kabupaten_maxes = ndimage.maximum(no2_filled, kabupaten_label_raster, label_ids)
+    
+    positive_label_raster = np.where(no2_filled >= 0, kabupaten_label_raster, 0)
+    positive_counts = np.bincount(positive_label_raster.ravel(), minlength=len(gdf) + 1)[1:]
+    positive_sums = ndimage.sum(no2_filled, positive_label_raster, label_ids)
+    positive_maxes = ndimage.maximum(no2_filled, positive_label_raster, label_ids)
+    
+    # High pollution threshold (>5×10¹⁵ molekul/cm²)
+    high_pollution_threshold = 5e15
+    
     province_results = {}
     high_pollution_areas = []
     
@@ -140,97 +227,51 @@ def calculate_regional_data(ds, gdf, province_column, kabupaten_column):
         # Get all kabupaten/kota for this province
         province_gdf = gdf[gdf[province_column] == province]
         
-        province_values = []
+        province_sum = 0.0
+        province_max = None
         province_pixels = 0
         kabupaten_results = []
         
-        # Process each kabupaten/kota
-        for idx, row in province_gdf.iterrows():
-            kabupaten_name = row[kabupaten_column]
-            geometry = row.geometry
+        # Collect each kabupaten/kota from the precomputed label statistics
+        for idx, kabupaten_name in zip(province_gdf.index, province_gdf[kabupaten_column]):
+            k = kabupaten_labels[idx] - 1
+            pixel_count = int(kabupaten_counts[k])
+            if pixel_count == 0:
+                continue
             
-            from rasterio import features
+            # Set negative values to zero for display purposes
+            avg_no2 = max(float(kabupaten_means[k]), 0.0)
+            max_no2 = max(float(kabupaten_maxes[k]), 0.0)
             
-            try:
-                # FIXED METHOD: Point-in-polygon approach (matches QGIS behavior)
-                # This method tests pixel centers directly instead of using geometry_mask
-                from shapely.geometry import Point
-                
-                # Find approximate bounds to limit search area
-                bounds = geometry.bounds
-                lon_mask = (lons >= bounds[0]) & (lons <= bounds[2])
-                lat_mask = (lats >= bounds[1]) & (lats <= bounds[3])
-                
-                lon_indices = np.where(lon_mask)[0]
-                lat_indices = np.where(lat_mask)[0]
-                
-                # Test each pixel center to see if it's inside the polygon
-                pixel_values = []
-                
-                for i in lat_indices:
-                    for j in lon_indices:
-                        point = Point(lons[j], lats[i])
-                        if geometry.contains(point):
-                            if not np.isnan(no2_2d[i, j]):
-                                pixel_values.append(no2_2d[i, j])
-                
-                no2_masked = np.array(pixel_values)
-                
-                # Filter valid data
-                valid_indices = ~np.isnan(no2_masked)
-                no2_valid = no2_masked[valid_indices]
-                
-                if len(no2_valid) > 0:
-                    # Filter out negative values for consistent processing
-                    no2_positive = no2_valid[no2_valid >= 0]
-                    
-                    # Calculate statistics for kabupaten/kota using all valid data
-                    avg_no2 = np.mean(no2_valid)
-                    max_no2 = np.max(no2_valid)
-                    pixel_count = len(no2_valid)
-                    
-                    # Set negative values to zero for display purposes
-                    if avg_no2 < 0:
-                        avg_no2 = 0.0
-                    if max_no2 < 0:
-                        max_no2 = 0.0
-                    
-                    # Add ONLY positive values to province totals for consistent averaging
-                    province_values.extend(no2_positive)
-                    province_pixels += len(no2_positive)  # Count only positive pixels
-                    
-                    kabupaten_results.append({
-                        'name': kabupaten_name,
-                        'average': float(avg_no2),
-                        'maximum': float(max_no2),
-                        'pixel_count': int(pixel_count)
-                    })
-                    
-                    # Check for high pollution (>5×10¹⁵ molekul/cm²)
-                    # Convert threshold: 5×10¹⁵ = 5×10¹⁵
-                    high_pollution_threshold = 5e15
-                    
-                    if avg_no2 > high_pollution_threshold:
-                        high_pollution_areas.append({
-                            'kabupaten': kabupaten_name,
-                            'province': province,
-                            'average_no2': float(avg_no2),
-                            'maximum_no2': float(max_no2),
-                            'average_no2_formatted': float(avg_no2 / 1e15),  # Convert to ×10¹⁵
-                            'maximum_no2_formatted': float(max_no2 / 1e15),
-                            'pixel_count': int(pixel_count)
-                        })
-                        print(f"      🚨 HIGH POLLUTION: {kabupaten_name} - Avg: {avg_no2/1e15:.1f}×10¹⁵")
-                
-            except Exception as e:
-                print(f"      ❌ Error processing {kabupaten_name}: {e}")
-                continue
+            # Add ONLY positive values to province totals for consistent averaging
+            if positive_counts[k] > 0:
+                province_sum += positive_sums[k]
+                province_pixels += int(positive_counts[k])
+                province_max = positive_maxes[k] if province_max is None else max(province_max, positive_maxes[k])
+            
+            kabupaten_results.append({
+                'name': kabupaten_name,
+                'average': avg_no2,
+                'maximum': max_no2,
+                'pixel_count': pixel_count
+            })
+            
+            if avg_no2 > high_pollution_threshold:
+                high_pollution_areas.append({
+                    'kabupaten': kabupaten_name,
+                    'province': province,
+                    'average_no2': avg_no2,
+                    'maximum_no2': max_no2,
+                    'average_no2_formatted': float(avg_no2 / 1e15),  # Convert to ×10¹⁵
+                    'maximum_no2_formatted': float(max_no2 / 1e15),
+                    'pixel_count': pixel_count
+                })
+                print(f"      🚨 HIGH POLLUTION: {kabupaten_name} - Avg: {avg_no2/1e15:.1f}×10¹⁵")
         
         # Calculate province average
-        if len(province_values) > 0:
-            # province_values already contains only positive values
-            province_avg = np.mean(province_values)
-            province_max = np.max(province_values)
+        if province_pixels > 0:
+            # Province totals contain only positive values
+            province_avg = province_sum / province_pixels
             
             province_results[province] = {
                 'average_no2': float(province_avg),
@@ -287,8 +328,12 @@ def save_json_results(province_results, high_pollution_areas, date_str):
     }
     
     # Save JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
     
     print(f"   ✅ Results saved to {output_file}")
     return output_file
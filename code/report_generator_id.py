@@ -12,12 +12,14 @@ from pathlib import Path
 class GeneratorLaporan:
     def __init__(self):
         self.data = None
+        self._ringkasan_angin = None
         
     def muat_laporan_json(self, path_json):
         """Memuat data analisis dari file JSON"""
         try:
             with open(path_json, 'r') as f:
                 self.data = json.load(f)
+            self._ringkasan_angin = None
             return True
         except Exception as e:
             print(f"Error memuat JSON: {e}")
@@ -36,7 +38,13 @@ class GeneratorLaporan:
             return timestamp_str
     
     def dapatkan_ringkasan_angin(self):
-        """Meringkas pola angin"""
+        """Meringkas pola angin (dihitung sekali per file JSON yang dimuat)"""
+        if self._ringkasan_angin is None:
+            self._ringkasan_angin = self._hitung_ringkasan_angin()
+        return self._ringkasan_angin
+    
+    def _hitung_ringkasan_angin(self):
+        """Menghitung ringkasan pola angin dari data yang dimuat"""
         if not self.data.get('wind_patterns'):
             return "Tidak terdeteksi pola angin yang signifikan"
         
@@ -113,7 +121,8 @@ TRANSPORT ATMOSFERIK:
         hotspots = self.data.get('hotspots', [])
         cakupan = stats.get('coverage', {})
         
-        laporan = f"""ANALISIS DATA SATELIT TROPOMI NO2
+        # Kumpulkan potongan teks dalam list lalu gabungkan sekali di akhir
+        bagian = [f"""ANALISIS DATA SATELIT TROPOMI NO2
 LAPORAN TEKNIS DETAIL
 
 ═══════════════════════════════════════════════════════════════════════
@@ -145,7 +154,7 @@ ANALISIS HOTSPOT
 ═══════════════════════════════════════════════════════════════════════
 Total Hotspot yang Terdeteksi: {len(hotspots)}
 
-10 Hotspot Polusi Teratas (berdasarkan konsentrasi):"""
+10 Hotspot Polusi Teratas (berdasarkan konsentrasi):"""]
 
         # Tambahkan hotspot teratas dengan prioritas nama lokasi
         for i, hotspot in enumerate(hotspots[:10], 1):
@@ -164,30 +173,30 @@ Total Hotspot yang Terdeteksi: {len(hotspots)}
                 lokasi_text = f"Area {lat_abs:.3f}°S, {geo_coords[0]:.3f}°E"
                 koordinat_text = f"Pixel: ({hotspot.get('centroid', [0, 0])[0]}, {hotspot.get('centroid', [0, 0])[1]})"
             
-            laporan += f"""
+            bagian.append(f"""
   {i:2d}. {lokasi_text}
       Konsentrasi Maks: {hotspot.get('max_concentration', 0):.2f} ×10¹⁵ molekul/cm²
       Rata-rata: {hotspot.get('avg_concentration', 0):.2f} ×10¹⁵ molekul/cm²
       {koordinat_text}
-      Area: {hotspot.get('area_pixels', 0)} piksel"""
+      Area: {hotspot.get('area_pixels', 0)} piksel""")
 
         # Bagian analisis angin
         pola_angin = self.data.get('wind_patterns', [])
-        laporan += f"""
+        bagian.append(f"""
 
 ANALISIS TRANSPORT ATMOSFERIK
 ═══════════════════════════════════════════════════════════════════════
 {self.dapatkan_ringkasan_angin()}
 
-Plume yang Terdeteksi: {len(pola_angin)}"""
+Plume yang Terdeteksi: {len(pola_angin)}""")
 
         if pola_angin:
-            laporan += "\nAnalisis Angin per Plume:"
+            bagian.append("\nAnalisis Angin per Plume:")
             for wp in pola_angin[:5]:  # Tampilkan 5 plume teratas
-                laporan += f"""
-  Plume {wp.get('plume_id', 'Tidak diketahui')}: {wp.get('estimated_wind_direction', 0):.1f}° (kepercayaan {wp.get('confidence', 'tidak diketahui')})"""
+                bagian.append(f"""
+  Plume {wp.get('plume_id', 'Tidak diketahui')}: {wp.get('estimated_wind_direction', 0):.1f}° (kepercayaan {wp.get('confidence', 'tidak diketahui')})""")
 
-        laporan += f"""
+        bagian.append(f"""
 
 PENILAIAN LINGKUNGAN
 ═══════════════════════════════════════════════════════════════════════
@@ -198,31 +207,31 @@ Penilaian Sumber Emisi:
 • {'Transport polusi regional terlihat jelas' if len(pola_angin) > 3 else 'Pola polusi lokal teramati'}
 
 REKOMENDASI
-═══════════════════════════════════════════════════════════════════════"""
+═══════════════════════════════════════════════════════════════════════""")
 
         # Buat rekomendasi berdasarkan temuan
         if stats.get('max_concentration', 0) > 20:
-            laporan += "\n• Disarankan pemantauan segera pada area berkonsentrasi tinggi"
-            laporan += "\n• Investigasi sumber emisi pada hotspot yang teridentifikasi"
+            bagian.append("\n• Disarankan pemantauan segera pada area berkonsentrasi tinggi")
+            bagian.append("\n• Investigasi sumber emisi pada hotspot yang teridentifikasi")
         elif stats.get('max_concentration', 0) > 15:
-            laporan += "\n• Lanjutkan pemantauan pada area berkonsentrasi meningkat"
-            laporan += "\n• Disarankan penilaian sumber emisi"
+            bagian.append("\n• Lanjutkan pemantauan pada area berkonsentrasi meningkat")
+            bagian.append("\n• Disarankan penilaian sumber emisi")
         else:
-            laporan += "\n• Pertahankan jadwal pemantauan rutin"
-            laporan += "\n• Lanjutkan surveilans atmosfer dasar"
+            bagian.append("\n• Pertahankan jadwal pemantauan rutin")
+            bagian.append("\n• Lanjutkan surveilans atmosfer dasar")
 
         if len(hotspots) > 8:
-            laporan += "\n• Disarankan validasi ground-truth multi-titik"
-            laporan += "\n• Direkomendasikan pembaruan inventori emisi komprehensif"
+            bagian.append("\n• Disarankan validasi ground-truth multi-titik")
+            bagian.append("\n• Direkomendasikan pembaruan inventori emisi komprehensif")
 
-        laporan += f"""
+        bagian.append(f"""
 
 ═══════════════════════════════════════════════════════════════════════
 Laporan dibuat oleh Sistem Analisis Otomatis TROPOMI NO2
 Analisis diselesaikan pada: {datetime.now().strftime("%d %B %Y pukul %H:%M:%S")}
-═══════════════════════════════════════════════════════════════════════"""
+═══════════════════════════════════════════════════════════════════════""")
 
-        return laporan
+        return "".join(bagian)
     
     def buat_ringkasan_singkat(self):
         """Menghasilkan ringkasan singkat yang mudah untuk copy-paste"""
@@ -237,6 +246,8 @@ Analisis diselesaikan pada: {datetime.now().strftime("%d %B %Y pukul %H:%M:%S")}
                 location = hotspot['location']
                 top_locations.append(f"{location['kabupaten']}")
         
+        ringkasan_angin = self.dapatkan_ringkasan_angin()
+        
         ringkasan = f"""Ringkasan Analisis TROPOMI NO2 - {self.format_waktu(self.data.get('analysis_timestamp', '')).split(' pukul')[0]}
 
 NO2 Maks: {stats.get('max_concentration', 0):.2f} ×10¹⁵ molekul/cm²
@@ -246,7 +257,7 @@ Cakupan Polusi Tinggi: {stats.get('coverage', {}).get('high_pollution', 0):.2f}%
 
 Status: {'SIAGA TINGGI' if stats.get('max_concentration', 0) > 25 else 'MENINGKAT' if stats.get('max_concentration', 0) > 15 else 'SEDANG' if stats.get('max_concentration', 0) > 10 else 'NORMAL'}
 Lokasi Utama: {', '.join(top_locations) if top_locations else 'Area laut/tidak teridentifikasi'}
-{self.dapatkan_ringkasan_angin().split(':')[1].strip() if ':' in self.dapatkan_ringkasan_angin() else 'Pola angin: Bervariasi'}"""
+{ringkasan_angin.split(':')[1].strip() if ':' in ringkasan_angin else 'Pola angin: Bervariasi'}"""
         
         return ringkasan
 
@@ -6,67 +6,201 @@ Free, open-source tool for automated analysis of atmospheric pollution data
 
 import cv2
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
 import json
+import os
+import glob
+import multiprocessing
 from datetime import datetime
 
+def _np_default(obj):
+    """json.dump hook converting NumPy scalars and arrays to native Python types"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Define color ranges for different concentration levels (OpenCV HSV bounds)
+COLOR_RANGES = {
+    'very_low': ([0, 0, 200], [180, 30, 255]),      # White/very light
+    'low': ([100, 50, 150], [130, 255, 255]),       # Light blue
+    'medium': ([60, 100, 100], [90, 255, 255]),     # Green
+    'high': ([20, 100, 100], [40, 255, 255]),       # Yellow
+    'very_high': ([0, 100, 100], [20, 255, 255])    # Red
+}
+
+CONCENTRATION_VALUES = {
+    'very_low': 2,
+    'low': 5,
+    'medium': 10,
+    'high': 20,
+    'very_high': 30
+}
+
+# The same ranges as uint8 arrays in level order
+_HSV_LOWERS = np.array([lower for lower, _ in COLOR_RANGES.values()], dtype=np.uint8)
+_HSV_UPPERS = np.array([upper for _, upper in COLOR_RANGES.values()], dtype=np.uint8)
+_CONC_VALUES = np.array([CONCENTRATION_VALUES[level] for level in COLOR_RANGES], dtype=np.uint8)
+
+def _hsv_classifier():
+    """Tables classifying HSV pixels in one pass: (per-channel bin LUT, bin weights, level LUT).
+    
+    The ranges only compare each channel against a few bounds, so a pixel's level depends only
+    on which interval between consecutive bounds each channel falls in. The level of every
+    interval combination is evaluated once here, with later ranges overwriting earlier ones.
+    """
+    starts = []
+    for c in range(3):
+        cuts = {0, *_HSV_LOWERS[:, c].tolist()}
+        cuts.update(upper + 1 for upper in _HSV_UPPERS[:, c].tolist() if upper < 255)
+        starts.append(np.array(sorted(cuts)))
+    counts = [len(s) for s in starts]
+    if np.prod(counts) > 256:
+        raise ValueError("COLOR_RANGES have too many distinct bounds for a uint8 bin code")
+    
+    bins = np.stack([np.searchsorted(s, np.arange(256), side='right') - 1 for s in starts], axis=-1)
+    weights = np.array([[counts[1] * counts[2], counts[2], 1]], dtype=np.float32)
+    
+    # Code h*ns*nv + s*nv + v, classified by the first channel value of each interval
+    corners = np.stack(np.meshgrid(*starts, indexing='ij'), axis=-1).reshape(-1, 3)
+    levels = np.zeros(256, dtype=np.uint8)
+    for lower, upper, value in zip(_HSV_LOWERS, _HSV_UPPERS, _CONC_VALUES):
+        inside = np.all((corners >= lower) & (corners <= upper), axis=1)
+        levels[:len(corners)][inside] = value
+    return bins.astype(np.uint8).reshape(1, 256, 3), weights, levels
+
+_HSV_BINS, _BIN_WEIGHTS, _BIN_LEVELS = _hsv_classifier()
+
+# Fraction of the image height holding the map; the legend sits below it
+MAP_AREA_FRACTION = 0.85
+
+_ANALYSIS_FIGURE = None
+
+def _analysis_figure():
+    """Shared 2x2 analysis figure with cleared panels; created once per process and reused"""
+    global _ANALYSIS_FIGURE
+    if _ANALYSIS_FIGURE is None:
+        # Matplotlib is only imported when a visualization is requested, so analysis-only
+        # callers skip its import cost
+        import matplotlib
+        matplotlib.use('Agg')  # Use non-interactive backend
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import Normalize
+        from matplotlib.cm import ScalarMappable
+        
+        fig, axes = plt.subplots(2, 2, figsize=(15, 12))
+        fig.suptitle('TROPOMI NO2 Automated Analysis Results', fontsize=16, fontweight='bold')
+        # The concentration panel always uses the fixed 0-30 scale, so its colorbar never changes
+        fig.colorbar(ScalarMappable(norm=Normalize(vmin=0, vmax=30), cmap='YlOrRd'),
+                     ax=axes[0, 1], label='NO2 (×10¹⁵ molec/cm²)')
+        # Every panel is drawn without axes and with a one-line title, so the tight layout is
+        # computed once for that shape and then frozen; re-running it on each draw made the
+        # output depend on the previous draw's state
+        for ax in axes.ravel():
+            ax.axis('off')
+            ax.set_title(' ')
+        fig.tight_layout()
+        fig.set_layout_engine('none')
+        _ANALYSIS_FIGURE = (fig, axes)
+    else:
+        fig, axes = _ANALYSIS_FIGURE
+        for ax in axes.ravel():
+            ax.clear()
+    return fig, axes
+
 class TropomiAnalyzer:
     def __init__(self):
+        self.image_bgr = None
         self.image = None
         self.processed_image = None
         self.concentration_map = None
         self.results = {}
-        
+        self._hsv = None
+        self._bin_codes = None
+        self._levels = None
+        self._reset_results()
+        
+    def _reset_results(self):
+        """Drop cached analysis results; called whenever the image or concentration map changes"""
+        self._hotspots = {}
+        self._stats = None
+        self._wind = None
+        self._components_cache = {}
+    
+    def _components(self, threshold):
+        """8-connected components of the map above threshold, labeled once and shared between
+        hotspot detection and wind analysis: (num_labels, labels, stats, centroids)"""
+        if threshold not in self._components_cache:
+            mask = self.concentration_map > threshold
+            self._components_cache[threshold] = cv2.connectedComponentsWithStats(
+                mask.view(np.uint8), connectivity=8
+            )
+        return self._components_cache[threshold]
+    
+    @property
+    def image(self):
+        """RGB image for display; converted from the loaded BGR data on first access"""
+        if self._image_rgb is None and self.image_bgr is not None:
+            # Convert BGR to RGB for matplotlib compatibility
+            self._image_rgb = cv2.cvtColor(self.image_bgr, cv2.COLOR_BGR2RGB)
+        return self._image_rgb
+    
+    @image.setter
+    def image(self, value):
+        self._image_rgb = value
+        self.image_bgr = None
+        self._map_area = None
+    
     def load_image(self, image_path):
-        """Load and preprocess satellite image"""
-        self.image = cv2.imread(image_path)
-        if self.image is None:
+        """Load satellite image and return it in RGB order (OpenCV BGR data is kept for analysis)"""
+        image_bgr = cv2.imread(image_path)
+        if image_bgr is None:
             raise ValueError(f"Could not load image from {image_path}")
         
-        # Convert BGR to RGB for matplotlib compatibility
-        self.image = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
-        print(f"Loaded image: {self.image.shape}")
+        self.image = None
+        self.image_bgr = image_bgr
+        # Main map area as a row-slice view (contiguous, no copy), computed once per image
+        self._map_area = image_bgr[:int(image_bgr.shape[0] * MAP_AREA_FRACTION)]
+        self.concentration_map = None
+        self._reset_results()
+        print(f"Loaded image: {image_bgr.shape}")
         return self.image
     
+    def _source_image(self):
+        """Loaded pixels with the cvtColor code converting them to HSV"""
+        if self.image_bgr is not None:
+            return self.image_bgr, cv2.COLOR_BGR2HSV
+        return self.image, cv2.COLOR_RGB2HSV
+    
     def extract_concentration_data(self):
         """Extract NO2 concentration values from color-coded image"""
         # Create mask for data area (exclude legend and labels)
-        height, width = self.image.shape[:2]
+        image, to_hsv = self._source_image()
         
         # Focus on the main map area (exclude legend at bottom)
-        map_area = self.image[:int(height * 0.85), :]
-        
-        # Convert to HSV for better color analysis
-        hsv = cv2.cvtColor(map_area, cv2.COLOR_RGB2HSV)
-        
-        # Define color ranges for different concentration levels
-        color_ranges = {
-            'very_low': ([0, 0, 200], [180, 30, 255]),      # White/very light
-            'low': ([100, 50, 150], [130, 255, 255]),       # Light blue
-            'medium': ([60, 100, 100], [90, 255, 255]),     # Green
-            'high': ([20, 100, 100], [40, 255, 255]),       # Yellow
-            'very_high': ([0, 100, 100], [20, 255, 255])    # Red
-        }
+        if self._map_area is None:
+            self._map_area = image[:int(image.shape[0] * MAP_AREA_FRACTION)]
+        map_area = self._map_area
         
-        concentration_values = {
-            'very_low': 2,
-            'low': 5,
-            'medium': 10,
-            'high': 20,
-            'very_high': 30
-        }
+        # Work buffers are reused while consecutive images share the same map size
+        if self._levels is None or self._levels.shape != map_area.shape[:2]:
+            self._hsv = np.empty(map_area.shape, dtype=np.uint8)
+            self._bin_codes = np.empty(map_area.shape[:2], dtype=np.uint8)
+            self._levels = np.empty(map_area.shape[:2], dtype=np.uint8)
         
-        # Create concentration map
-        self.concentration_map = np.zeros(map_area.shape[:2], dtype=np.float32)
+        # Convert to HSV for better color analysis
+        hsv = cv2.cvtColor(map_area, to_hsv, dst=self._hsv)
         
-        for level, (lower, upper) in color_ranges.items():
-            lower = np.array(lower)
-            upper = np.array(upper)
-            mask = cv2.inRange(hsv, lower, upper)
-            self.concentration_map[mask > 0] = concentration_values[level]
+        # Create concentration map; the level values (0-30) fit in uint8, a quarter of the
+        # bytes of float32 for every later pass over the map.
+        # One pass bins all three channels, a second folds the bins into one code per pixel
+        # and a third maps codes to levels, instead of an inRange pass and a scatter per range.
+        bins = cv2.LUT(hsv, _HSV_BINS, dst=hsv)
+        codes = cv2.transform(bins, _BIN_WEIGHTS, dst=self._bin_codes)
+        self.concentration_map = cv2.LUT(codes, _BIN_LEVELS, dst=self._levels)
+        self._reset_results()
         
         return self.concentration_map
     
@@ -74,117 +208,134 @@ class TropomiAnalyzer:
         """Detect pollution hotspots above threshold"""
         if self.concentration_map is None:
             self.extract_concentration_data()
-        
-        # Create binary mask for hotspots
-        hotspot_mask = self.concentration_map > threshold
+        if threshold in self._hotspots:
+            return self._hotspots[threshold]
         
         # Find connected components (hotspot regions)
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
-            hotspot_mask.astype(np.uint8), connectivity=8
-        )
-        
-        hotspots = []
-        for i in range(1, num_labels):  # Skip background (label 0)
-            area = stats[i, cv2.CC_STAT_AREA]
-            if area > 10:  # Filter out tiny noise
-                centroid_x, centroid_y = centroids[i]
-                max_concentration = np.max(self.concentration_map[labels == i])
-                
-                hotspots.append({
-                    'id': i,
-                    'centroid': (int(centroid_x), int(centroid_y)),
-                    'area_pixels': area,
-                    'max_concentration': max_concentration,
-                    'avg_concentration': np.mean(self.concentration_map[labels == i])
-                })
-        
-        # Sort by concentration level
-        hotspots.sort(key=lambda x: x['max_concentration'], reverse=True)
+        num_labels, labels, stats, centroids = self._components(threshold)
+        
+        # Per-component max and mean in one pass over the hotspot pixels instead of
+        # two full-image `labels == i` masks per component
+        in_hotspot = labels > 0
+        component = labels[in_hotspot]
+        values = self.concentration_map[in_hotspot]
+        areas = stats[:, cv2.CC_STAT_AREA]
+        sums = np.bincount(component, weights=values, minlength=num_labels)
+        maxima = np.zeros(num_labels, dtype=self.concentration_map.dtype)
+        np.maximum.at(maxima, component, values)
+        
+        kept = np.flatnonzero(areas[1:] > 10) + 1  # Skip background (label 0), filter out tiny noise
+        
+        # Sort by concentration level (stable, so equal maxima keep label order)
+        kept = kept[np.argsort(-maxima[kept].astype(np.int16), kind='stable')]
+        
+        hotspots = [
+            {
+                'id': int(i),
+                'centroid': (int(centroids[i, 0]), int(centroids[i, 1])),
+                'area_pixels': int(areas[i]),
+                'max_concentration': float(maxima[i]),
+                'avg_concentration': float(sums[i] / areas[i])
+            }
+            for i in kept
+        ]
+        self._hotspots[threshold] = hotspots
         return hotspots
     
     def calculate_statistics(self):
         """Calculate comprehensive statistics"""
         if self.concentration_map is None:
             self.extract_concentration_data()
+        if self._stats is not None:
+            return self._stats
         
-        # Remove zero values (background/water)
-        valid_data = self.concentration_map[self.concentration_map > 0]
+        # The map only holds whole-number level values, so one histogram gives every statistic
+        # without extracting the valid pixels or sorting them for the median
+        counts = np.bincount(self.concentration_map.ravel(), minlength=31)
+        counts[0] = 0  # Remove zero values (background/water)
+        total_area = int(counts.sum())
         
         stats = {
-            'total_pixels_analyzed': len(valid_data),
-            'max_concentration': float(np.max(valid_data)) if len(valid_data) > 0 else 0,
-            'min_concentration': float(np.min(valid_data)) if len(valid_data) > 0 else 0,
-            'mean_concentration': float(np.mean(valid_data)) if len(valid_data) > 0 else 0,
-            'median_concentration': float(np.median(valid_data)) if len(valid_data) > 0 else 0,
-            'std_concentration': float(np.std(valid_data)) if len(valid_data) > 0 else 0,
+            'total_pixels_analyzed': total_area,
+            'max_concentration': 0,
+            'min_concentration': 0,
+            'mean_concentration': 0,
+            'median_concentration': 0,
+            'std_concentration': 0,
         }
         
-        # Calculate area coverage for different concentration levels
-        total_area = np.sum(self.concentration_map > 0)
         if total_area > 0:
+            values = np.arange(len(counts), dtype=np.float64)
+            present = np.flatnonzero(counts)
+            mean = float(values @ counts) / total_area
+            # Median as np.median: middle value, or the mean of the two middle values for even counts
+            cumulative = np.cumsum(counts)
+            lower_mid = values[np.searchsorted(cumulative, (total_area - 1) // 2, side='right')]
+            upper_mid = values[np.searchsorted(cumulative, total_area // 2, side='right')]
+            stats.update({
+                'max_concentration': float(present[-1]),
+                'min_concentration': float(present[0]),
+                'mean_concentration': mean,
+                'median_concentration': float((lower_mid + upper_mid) / 2),
+                'std_concentration': float(np.sqrt(((values - mean) ** 2) @ counts / total_area)),
+            })
+            
+            # Calculate area coverage for different concentration levels
             stats['coverage'] = {
-                'low_pollution': float(np.sum((self.concentration_map >= 2) & (self.concentration_map < 8)) / total_area * 100),
-                'moderate_pollution': float(np.sum((self.concentration_map >= 8) & (self.concentration_map < 15)) / total_area * 100),
-                'high_pollution': float(np.sum(self.concentration_map >= 15) / total_area * 100)
+                'low_pollution': float(counts[2:8].sum() / total_area * 100),
+                'moderate_pollution': float(counts[8:15].sum() / total_area * 100),
+                'high_pollution': float(counts[15:].sum() / total_area * 100)
             }
         
+        self._stats = stats
         return stats
     
     def analyze_wind_patterns(self):
         """Analyze wind direction from plume orientation"""
         if self.concentration_map is None:
             self.extract_concentration_data()
-        
-        # Find high concentration areas
-        high_conc_mask = self.concentration_map > 15
-        
-        if np.sum(high_conc_mask) == 0:
-            return {"message": "No significant pollution plumes detected"}
-        
-        # Find contours of high concentration areas
-        contours, _ = cv2.findContours(
-            high_conc_mask.astype(np.uint8), 
-            cv2.RETR_EXTERNAL, 
-            cv2.CHAIN_APPROX_SIMPLE
-        )
+        if self._wind is not None:
+            return self._wind
+        
+        # Each 8-connected high concentration area is one plume (the same components as the
+        # default hotspots); its orientation comes from the second-order central moments,
+        # accumulated for all plumes at once with np.bincount
+        num_labels, labels, stats, centroids = self._components(15)
+        
+        if num_labels == 1:
+            self._wind = {"message": "No significant pollution plumes detected"}
+            return self._wind
+        
+        ys, xs = np.nonzero(labels)
+        plume = labels[ys, xs]
+        dx = xs - centroids[plume, 0]
+        dy = ys - centroids[plume, 1]
+        mu20 = np.bincount(plume, weights=dx * dx, minlength=num_labels)
+        mu02 = np.bincount(plume, weights=dy * dy, minlength=num_labels)
+        mu11 = np.bincount(plume, weights=dx * dy, minlength=num_labels)
+        
+        # Same convention as cv2.fitEllipse: angle of the ellipse's first axis, perpendicular
+        # to the major axis at 0.5 * atan2(2 * mu11, mu20 - mu02)
+        orientations = (np.degrees(0.5 * np.arctan2(2 * mu11, mu20 - mu02)) + 90) % 180
+        areas = stats[:, cv2.CC_STAT_AREA]
         
         wind_analysis = []
-        for i, contour in enumerate(contours):
-            if cv2.contourArea(contour) > 50:  # Filter small contours
-                # Fit ellipse to determine orientation
-                if len(contour) >= 5:
-                    ellipse = cv2.fitEllipse(contour)
-                    angle = ellipse[2]  # Angle of major axis
-                    
-                    # Convert to wind direction (perpendicular to plume)
-                    wind_direction = (angle + 90) % 360
-                    
-                    wind_analysis.append({
-                        'plume_id': i + 1,
-                        'estimated_wind_direction': wind_direction,
-                        'plume_orientation': angle,
-                        'confidence': 'medium' if cv2.contourArea(contour) > 100 else 'low'
-                    })
-        
+        for i in np.flatnonzero(areas[1:] > 50) + 1:  # Filter small plumes
+            angle = float(orientations[i])
+            
+            # Convert to wind direction (perpendicular to plume)
+            wind_direction = (angle + 90) % 360
+            
+            wind_analysis.append({
+                'plume_id': int(i),
+                'estimated_wind_direction': wind_direction,
+                'plume_orientation': angle,
+                'confidence': 'medium' if areas[i] > 100 else 'low'
+            })
+        
+        self._wind = wind_analysis
         return wind_analysis
     
-    def _convert_numpy_types(self, obj):
-        """Convert NumPy types to Python native types for JSON serialization"""
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: self._convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, tuple):
-            return tuple(self._convert_numpy_types(item) for item in obj)
-        else:
-            return obj
-
     def generate_report(self, output_path='tropomi_analysis_report.json'):
         """Generate comprehensive analysis report"""
         if self.concentration_map is None:
@@ -193,7 +344,7 @@ class TropomiAnalyzer:
         report = {
             'analysis_timestamp': datetime.now().isoformat(),
             'image_info': {
-                'dimensions': list(self.image.shape),
+                'dimensions': list(self._source_image()[0].shape),
                 'analysis_area_pixels': int(np.sum(self.concentration_map > 0))
             },
             'statistics': self.calculate_statistics(),
@@ -201,23 +352,19 @@ class TropomiAnalyzer:
             'wind_patterns': self.analyze_wind_patterns()
         }
         
-        # Convert NumPy types for JSON serialization
-        report = self._convert_numpy_types(report)
-        
-        # Save to JSON
+        # Save to JSON; leftover NumPy values are converted by the encoder hook
         with open(output_path, 'w') as f:
-            json.dump(report, f, indent=2)
+            json.dump(report, f, indent=2, default=_np_default)
         
         print(f"Analysis report saved to: {output_path}")
         return report
     
-    def create_analysis_visualization(self, output_path='tropomi_analysis.png'):
+    def create_analysis_visualization(self, output_path='tropomi_analysis.png', dpi=150):
         """Create visualization with annotations"""
         if self.concentration_map is None:
             self.extract_concentration_data()
         
-        fig, axes = plt.subplots(2, 2, figsize=(15, 12))
-        fig.suptitle('TROPOMI NO2 Automated Analysis Results', fontsize=16, fontweight='bold')
+        fig, axes = _analysis_figure()
         
         # Original image
         axes[0, 0].imshow(self.image)
@@ -225,10 +372,9 @@ class TropomiAnalyzer:
         axes[0, 0].axis('off')
         
         # Concentration map
-        im = axes[0, 1].imshow(self.concentration_map, cmap='YlOrRd', vmin=0, vmax=30)
+        axes[0, 1].imshow(self.concentration_map, cmap='YlOrRd', vmin=0, vmax=30)
         axes[0, 1].set_title('Extracted Concentration Map')
         axes[0, 1].axis('off')
-        plt.colorbar(im, ax=axes[0, 1], label='NO2 (×10¹⁵ molec/cm²)')
         
         # Hotspot detection
         hotspots = self.detect_hotspots()
@@ -263,13 +409,28 @@ class TropomiAnalyzer:
         axes[1, 1].set_title('Analysis Statistics')
         axes[1, 1].axis('off')
         
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        fig.savefig(output_path, dpi=dpi)
         print(f"Analysis visualization saved to: {output_path}")
-        plt.close()
         
         return output_path
 
+def analyze(image_path):
+    """Analyze one image, writing its report and visualization next to it (used for batches)"""
+    analyzer = TropomiAnalyzer()
+    analyzer.load_image(image_path)
+    base_path = os.path.splitext(image_path)[0]
+    report = analyzer.generate_report(f"{base_path}_analysis_report.json")
+    analyzer.create_analysis_visualization(f"{base_path}_analysis.png")
+    return report
+
+def _analyze_batch_item(image_path):
+    """Pool worker: analyze one image and return (path, report, error) so one failure
+    does not abort the rest of the batch"""
+    try:
+        return image_path, analyze(image_path), None
+    except Exception as e:
+        return image_path, None, str(e)
+
 def main():
     """Example usage"""
     analyzer = TropomiAnalyzer()
@@ -277,10 +438,26 @@ def main():
     # Example with your image (adjust path as needed)
     try:
         # Load the satellite image
-        image_path = input("Enter path to TROPOMI image (or press Enter for default): ").strip()
+        image_path = input("Enter path to TROPOMI image or glob pattern (or press Enter for default): ").strip()
         if not image_path:
             print("Please provide the path to your TROPOMI satellite image")
             return
+        
+        # Several matching images are independent, so analyze them in parallel worker processes
+        image_paths = sorted(glob.glob(image_path))
+        if len(image_paths) > 1:
+            print(f"Running automated analysis on {len(image_paths)} images...")
+            failed = 0
+            with multiprocessing.Pool(os.cpu_count(), maxtasksperchild=4) as pool:
+                for path, report, error in pool.imap_unordered(_analyze_batch_item, image_paths):
+                    if error is not None:
+                        failed += 1
+                        print(f"{path}: Error: {error}")
+                        continue
+                    print(f"{path}: Max {report['statistics']['max_concentration']:.2f}, "
+                          f"Hotspots {len(report['hotspots'])}")
+            print(f"Analyzed {len(image_paths) - failed} of {len(image_paths)} images")
+            return
             
         analyzer.load_image(image_path)
         
@@ -177,10 +177,13 @@ def main():
 
     final_original_file = process_and_save_data(ds.copy(), date_str, method="original")
 
-    stacked = ds.stack(points=('y', 'x')).dropna(dim='points')
-    valid_points = np.vstack((stacked.y.values, stacked.x.values)).T
-    valid_values = stacked.NO2.values
-    grid_x, grid_y = np.meshgrid(ds.x.values, ds.y.values)
+    # Plain NumPy mask instead of stack/dropna, which builds a pandas MultiIndex over every pixel
+    no2 = ds['NO2'].values
+    ys, xs = np.nonzero(~np.isnan(no2))
+    valid_points = np.column_stack((ds['y'].values[ys], ds['x'].values[xs]))
+    valid_values = no2[ys, xs]
+    # griddata broadcasts the target axes itself, so no dense meshgrid is needed
+    grid_y, grid_x = np.ix_(ds.y.values, ds.x.values)
 
     print("\n🔄 Interpolating data with Scipy Griddata (linear)...")
     griddata_linear = griddata(valid_points, valid_values, (grid_y, grid_x), method='linear')
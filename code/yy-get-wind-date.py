@@ -1,4 +1,3 @@
-import cdsapi
 import sys
 from datetime import datetime
 
@@ -27,6 +26,9 @@ def main():
     
     print(f"📅 Processing wind data for date: {date_str}")
 
+    # Imported only once the arguments are valid; the CDS client pulls in a heavy HTTP stack
+    import cdsapi
+
     dataset = "cams-global-atmospheric-composition-forecasts"
     request = {
         "pressure_level": ["1000"],